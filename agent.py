@@ -15,6 +15,7 @@ from typing import List, Callable, Dict, Any
 
 from response_parser import ResponseParser
 from llm import LLM, OpenAIModel
+from metrics import METRICS
 import inspect
 import re
 from datetime import datetime
@@ -178,12 +179,14 @@ class ReactAgent:
         # Set the user prompt content
         self.set_message_content(self.user_message_id, task)
 
-        for _ in range(min(max_steps, 100)):
+        for step in range(1, min(max_steps, 100) + 1):
+            METRICS.inc("swe_agent_steps_total")
             # Build context from root to current
             context = self.get_context()
 
             # Query LLM
-            llm_output = self.llm.generate(context)
+            with METRICS.timer("swe_llm_latency_seconds"):
+                llm_output = self.llm.generate(context)
             # Append assistant message
             assistant_id = self.add_message("assistant", llm_output)
             # Parse function call
@@ -203,7 +206,8 @@ class ReactAgent:
             else:
                 try:
                     # Match call signature simply by using kwargs subset
-                    tool_result = tool_fn(**args)
+                    with METRICS.timer("swe_tool_latency_seconds", tool=name):
+                        tool_result = tool_fn(**args)
                 except Exception as e:
                     tool_result = r_str(f"ToolError: {e}")
 
@@ -212,9 +216,11 @@ class ReactAgent:
 
             # If finish is called, return
             if name == "finish":
+                METRICS.observe("swe_agent_steps_per_instance", step)
                 return str(tool_result)
 
         # Max steps reached without finish
+        METRICS.observe("swe_agent_steps_per_instance", min(max_steps, 100))
         raise RuntimeError("LimitsExceeded: maximum steps reached without finish")
 
     def message_id_to_context(self, message_id: int) -> str:
@@ -243,7 +249,8 @@ class ReactAgent:
                     f"WHEN CALLING TOOLS, MAKE SURE TO INCLUDE BOTH THE ARGUMENT NAME AND VALUE OF EACH ARGUMENT WITHIN AN " + \
                     f"SINGLE ARGUMENT BLOCK, NOT ACROSS MULTIPLE ARGUMENT BLOCKS. ALSO, MAKE SURE TO RETURN ONLY A SINGLE " + \
                     f"END FUNCTION CALL BLOCK. DO NOT RETURN THE FIXES OR EXPLAIN THE FIXES IN PLAIN TEXT. RATHER, APPLY THE BEST FIX YOU CAN THINK OF INTO THE SOURCE " + \
-                    f"CODE BY MODIFYING THE FILES. ALWAYS MODIFY THE FILES IN THE REPO!! AFTER EACH MODIFICATION, MAKE SURE TO CHECK IF THE FIX IS WORKING CORRECTLY." + \
+                    f"CODE BY MODIFYING THE FILES. ALWAYS MODIFY THE FILES IN THE REPO!! AFTER EACH MODIFICATION, MAKE SURE TO CHECK IF THE FIX IS WORKING CORRECTLY. " + \
+                    f"IF THE 'run_tests' TOOL IS AVAILABLE, USE IT TO RUN THE RELATED TESTS INSTEAD OF RUNNING WHOLE TEST SUITES. " + \
                     f"THE CHANGES YOU MAKE WILL BE LATER EVALUATED USING 'git add -A && git diff --cached'. BEFORE CALLING 'finish', " + \
                     f"MAKE SURE TO CHECK IF THE PATCH CAN BE PARSED CORRECTLY BY RUNNING 'git add -A && git diff --cached'. " + \
                     f"TO SEE IF THE CHANGES ARE DETECTED. IF NOTHING IS DETECTED, MAKE SURE TO ADD THE CHANGES TO THE REPO " + \
@@ -1,9 +1,89 @@
 from utils import get_sb_environment
+from search_index import get_index, read_working_tree
+from metrics import METRICS
+from targeted_tests import RUN_TESTS_TIMEOUT, build_test_command, get_test_map, select_tests, summarize_test_output
+import re
+import shlex
 import subprocess
 
 def y_str(s): # yellow
     return "\033[33m" + s + "\033[0m"
 
+# Commands whose output only depends on the working tree, so it can be reused until something writes
+READ_ONLY_COMMANDS = {
+    "cat", "ls", "head", "tail", "grep", "egrep", "fgrep", "rg", "find", "nl", "wc", "pwd",
+    "tree", "stat", "file", "diff", "sed", "sort", "uniq", "cut", "cd", "echo", "which",
+}
+READ_ONLY_GIT_COMMANDS = {"status", "diff", "log", "show", "grep", "ls-files", "blame", "rev-parse"}
+_HARMLESS_REDIRECT_RE = re.compile(r"\d?>\s*/dev/null|\d?>&\d")
+_COMMAND_SEPARATOR_RE = re.compile(r"&&|\|\||[;|&\n]")
+# Only `sed -n` with line address print scripts (e.g. `sed -n 10,20p f`) is treated as read-only
+_SED_PRINT_SCRIPT_RE = re.compile(r"^(\d+|\$)?(,(\d+|\$))?p$")
+
+
+def _has_short_flag(arg: str, flag: str) -> bool:
+    """Whether `arg` is a group of short options (e.g. `-ni`) containing `flag`."""
+    return arg.startswith("-") and not arg.startswith("--") and flag in arg[1:]
+
+
+def _is_print_only_sed(args: list[str]) -> bool:
+    """Whether `sed args` only prints lines, so it cannot write files through `w`/`-i`."""
+    if "-n" not in args:
+        return False
+    scripts, files, expect_script = [], [], False
+    for arg in args:
+        if expect_script:
+            scripts.append(arg)
+            expect_script = False
+        elif arg == "-e":
+            expect_script = True
+        elif arg == "-n":
+            continue
+        elif arg.startswith("-"):
+            return False
+        else:
+            files.append(arg)
+    if not scripts and files:
+        scripts.append(files.pop(0))
+    return bool(scripts) and all(_SED_PRINT_SCRIPT_RE.match(s) for s in scripts)
+
+
+def is_read_only_command(command: str) -> bool:
+    """
+    Conservatively classify a shell command as read-only: every segment of the pipeline
+    must start with a known read-only command and nothing may be redirected into a file.
+    """
+    command = _HARMLESS_REDIRECT_RE.sub(" ", command)
+    if any(token in command for token in (">", "`", "$(", "<(")):
+        return False
+    for segment in _COMMAND_SEPARATOR_RE.split(command):
+        try:
+            words = shlex.split(segment)
+        except ValueError:
+            return False
+        if not words:
+            continue
+        name, args = words[0], words[1:]
+        if name == "git":
+            if not args or args[0] not in READ_ONLY_GIT_COMMANDS:
+                return False
+            if any(a == "-o" or a.startswith("--output") for a in args):
+                return False
+        elif name not in READ_ONLY_COMMANDS:
+            return False
+        elif name == "sed" and not _is_print_only_sed(args):
+            return False
+        elif name == "tail" and any(_has_short_flag(a, "f") or _has_short_flag(a, "F") or a.startswith("--follow") for a in args):
+            return False
+        elif name in ("sort", "tree") and any(_has_short_flag(a, "o") or a.startswith("--output") for a in args):
+            return False
+        elif name == "uniq" and len([a for a in args if not a.startswith("-")]) > 1:
+            # The second positional argument of uniq is an output file
+            return False
+        elif name == "find" and any(a in ("-delete", "-exec", "-execdir", "-ok", "-okdir", "-fprint", "-fprint0", "-fprintf", "-fls") for a in args):
+            return False
+    return True
+
 class LimitsExceeded(Exception):
     """Raised when the agent has reached its step limit."""
 
@@ -16,21 +96,62 @@ class SWEEnvironment:
     - execute(command: str) -> str: Run a shell command and return stdout, or raise ValueError on failure
     """
 
+    # Marker file whose mtime is the baseline for detecting files written through the shell
+    CHANGE_MARKER = "/tmp/.swe_env_baseline"
+    CHECK_INDEX = "/tmp/.swe_env_check_index"
+    PATCH_FILE = "/tmp/.swe_env_patch.diff"
+    CHECK_LOG = "/tmp/.swe_env_patch_check.log"
+    PATCH_MARKER = "----SWE_ENV_PATCH_CHECK----"
+
     def __init__(self, instance: dict):
         self.env = get_sb_environment(instance)
+        self.instance = instance
+        # Paths (relative to /testbed) modified through the edit tools
+        self.modified_paths: set[str] = set()
+        try:
+            self.env.execute(f"touch {self.CHANGE_MARKER}")
+        except Exception:
+            # The caller never gets this environment, so stop the container here
+            self.env.cleanup()
+            raise
+        METRICS.inc("swe_containers_active")
+        # Results of read-only commands: command -> (generation, output). The generation is
+        # bumped by every write, which invalidates all cached results.
+        self.generation = 0
+        self.command_cache: dict[str, tuple[int, dict]] = {}
+        # Working tree content of the changed paths for search_code, None until (re)read
+        self.search_overlay: dict[str, str | None] | None = None
      
+    def cleanup(self) -> None:
+        """Stop the container of this environment."""
+        try:
+            self.env.cleanup()
+        finally:
+            METRICS.dec("swe_containers_active")
+
     # -------------------- REQUIRED TOOLS --------------------
     def run_bash_cmd(self, command: str) -> str:
         """
         Run the command in a bash shell and return the output or throw a ValueError
         if the process returns non-zero exit code.
 
+        Read-only commands (cat, ls, grep, git status, ...) re-run with no write in between
+        return the previous output, marked as cached.
+
         Args;
             command (str): the shell command to run
 
         Returns:
             The output of running the shell command
         """
+        read_only = is_read_only_command(command)
+        if read_only:
+            cached = self.command_cache.get(command)
+            if cached is not None and cached[0] == self.generation:
+                output = cached[1]
+                return {**output, "output": "[cached: same output as the previous run of this command, no writes since]\n" + output.get("output", "")}
+        else:
+            self.mark_written()
         try:
             output = self.env.execute(command)
         except subprocess.TimeoutExpired as e:
@@ -38,7 +159,15 @@ class SWEEnvironment:
             raise ValueError(output)
         except TimeoutError:
             raise ValueError("TimeoutError")
+        if read_only:
+            self.command_cache[command] = (self.generation, output)
         return output
+
+    def mark_written(self) -> None:
+        """Invalidate the cached results of read-only commands after a (possible) write."""
+        self.generation += 1
+        self.command_cache.clear()
+        self.search_overlay = None
     def _extract_unified_diff(self, text: str) -> str:
         if not text:
             return ""
@@ -56,24 +185,86 @@ class SWEEnvironment:
             return text[j:].rstrip("\n") + "\n"
         return ""
 
+    def _record_modified_path(self, file_path: str) -> None:
+        path = str(file_path).strip()
+        if path.startswith("/testbed/"):
+            path = path[len("/testbed/"):]
+        if path.startswith("./"):
+            path = path[2:]
+        if path and not path.startswith("/"):
+            self.modified_paths.add(path)
+
+    def changed_paths(self) -> list[str]:
+        """
+        Return the paths touched since the environment was created: paths recorded by the
+        edit tools, files written through the shell (status changed after the baseline marker)
+        and tracked files that differ from HEAD in the index or working tree.
+        """
+        paths = set(self.modified_paths)
+        # -cnewer compares the inode change time, which mv, cp -p and tar x cannot preserve.
+        # Ignored files (build artifacts, caches) are dropped by `git check-ignore`; deleted and
+        # `git mv`-ed tracked files are listed by `git diff` from the index.
+        snapshot_cmd = (
+            f"find . -path ./.git -prune -o -type f -cnewer {self.CHANGE_MARKER} -print | "
+            "git check-ignore --stdin --non-matching --verbose | sed -n 's/^::\t//p'; "
+            "git diff --name-only --no-renames HEAD"
+        )
+        res = self.env.execute(snapshot_cmd)
+        for line in res.get("output", "").splitlines():
+            line = line.strip()
+            if line.startswith("./"):
+                line = line[2:]
+            if line:
+                paths.add(line)
+        return sorted(paths)
+
     def generate_patch(self, result: str) -> str:
         """
         Generate a patch from the result (for SWE-Bench)
+
+        Only the paths changed since the environment was created are staged and diffed, and
+        the patch is checked with 'git apply --check' against a clean index of HEAD. A failed
+        check is only logged, so the agent's changes are still submitted.
         """
         try:
-            patch_output = self.env.execute("git add -A && git diff --cached")
-            print(y_str(f"Patch output: ") + f"{patch_output}")
-            if patch_output["output"].strip():
-                return patch_output["output"].strip()
-            else:
-                fallback = self._extract_unified_diff(result or "")
-                if fallback:
-                    print(y_str(f"Fallback patch: ") + f"{fallback}")
-                    return fallback
-                return f"{result}\n\nNo changes detected to generate a patch."
+            paths = self.changed_paths()
+            if paths:
+                self.mark_written()  # stages the changes, so `git status`/`git diff` output changes
+                quoted = " ".join(shlex.quote(p) for p in paths)
+                # Stage, diff, check and print the patch in a single exec; the check status is
+                # printed after PATCH_MARKER, followed by the patch itself
+                patch_output = self.env.execute(
+                    f"git ls-files -z -m -o -d --exclude-standard -- {quoted} | xargs -0 -r git add -A -- && "
+                    f"git diff --cached --binary -- {quoted} > {self.PATCH_FILE} || exit 1; "
+                    f"{{ GIT_INDEX_FILE={self.CHECK_INDEX} git read-tree HEAD && "
+                    f"GIT_INDEX_FILE={self.CHECK_INDEX} git apply --check --cached {self.PATCH_FILE}; }} > {self.CHECK_LOG} 2>&1; "
+                    f"status=$?; [ $status -ne 0 ] && cat {self.CHECK_LOG}; "
+                    f"echo {self.PATCH_MARKER}$status; cat {self.PATCH_FILE}"
+                )
+                output = patch_output.get("output", "")
+                marker = output.find(self.PATCH_MARKER)
+                if patch_output.get("returncode", 0) or marker == -1:
+                    print(y_str(f"Failed to diff changed paths: ") + f"{output}")
+                    # Fall back to diffing the whole working tree
+                    full_output = self.env.execute("git add -A && git diff --cached --binary")
+                    if not full_output.get("returncode", 0) and full_output["output"].strip():
+                        return full_output["output"].strip()
+                else:
+                    status, _, patch = output[marker + len(self.PATCH_MARKER):].partition("\n")
+                    print(y_str(f"Patch output: ") + f"{patch}")
+                    if status.strip() != "0":
+                        # Still submit the diff rather than losing the agent's work
+                        print(y_str(f"Patch failed 'git apply --check': ") + f"{output[:marker]}")
+                    if patch.strip():
+                        return patch.strip()
+            fallback = self._extract_unified_diff(result or "")
+            if fallback:
+                print(y_str(f"Fallback patch: ") + f"{fallback}")
+                return fallback
+            return f"{result}\n\nNo changes detected to generate a patch."
         except Exception as e:
             return f"{result}\n\nError running git commands: {e}"
-    
+
     # -------------------- TODO(student): add more functions here if you want --------------------
     def replace_in_file(self, file_path: str, from_line: int, to_line: int, content: str) -> str:
         """
@@ -102,9 +293,11 @@ class SWEEnvironment:
 
         # Write back (quoted heredoc prevents expansion)
         write_cmd = f"cat > {file_path} << 'MINISWE_EOF'\n{new_text}MINISWE_EOF"
+        self.mark_written()
         wres = self.env.execute(write_cmd)
         if isinstance(wres, dict) and wres.get("returncode", 0):
             raise ValueError(wres.get("output", ""))
+        self._record_modified_path(file_path)
 
         return f"Replaced lines {from_line}-{to_line} in {file_path}."
     
@@ -119,6 +312,63 @@ class SWEEnvironment:
         except Exception as e:
             raise ValueError(f"Failed to read file '{file_path}': {e}")
 
+    def _get_index(self):
+        commit = self.instance.get("base_commit") or self.env.execute("git rev-parse HEAD")["output"].strip()
+        repo = self.instance.get("repo") or self.instance["instance_id"].rsplit("-", 1)[0]
+        return get_index(self.env, repo, commit)
+
+    def search_code(self, query: str, path_glob: str = "") -> str:
+        """
+        Search the repository for a literal string (e.g. a function name or an error message)
+        using a prebuilt index. Much faster than 'grep -r' and ranks symbol definitions first.
+        Case-insensitive unless the query contains upper case letters.
+
+        Args:
+            query (str): the literal text to search for
+            path_glob (str): optional glob to restrict the files searched (e.g. 'django/db/*')
+
+        Returns:
+            Matching lines formatted as 'path:line: content', best matches first
+        """
+        query = str(query).strip("\n")
+        if not query:
+            raise ValueError("Empty search query")
+        index = self._get_index()
+        if self.search_overlay is None:
+            # Only re-snapshot the tree after a write; repeated queries reuse the overlay
+            self.search_overlay = read_working_tree(self.env, self.changed_paths())
+        total, hits = index.search(query, str(path_glob).strip(), self.search_overlay)
+        if not hits:
+            return f"No matches found for '{query}'."
+        lines = [f"{path}:{lineno}: {line}" for path, lineno, line in hits]
+        header = f"{total} matches for '{query}'" + (f" (showing the best {len(hits)})" if total > len(hits) else "")
+        return header + "\n" + "\n".join(lines)
+
+    def run_tests(self, test_paths: str = "") -> str:
+        """
+        Run the tests related to the files you changed, in parallel and with a longer timeout
+        than run_bash_cmd. Use this instead of running whole test suites with run_bash_cmd.
+
+        Args:
+            test_paths (str): optional space separated test files to run; by default the tests
+                related to the changed files (tests importing them or named after them) are selected
+
+        Returns:
+            A compact summary: pass/fail counts and the tracebacks of the failing tests
+        """
+        index = self._get_index()
+        tests = str(test_paths).split()
+        if not tests:
+            tests = select_tests(get_test_map(index), self.changed_paths())
+        if not tests:
+            return "No tests related to the changed files were found. Pass the test files to run in 'test_paths'."
+        self.mark_written()  # tests may write to the working tree
+        try:
+            res = self.env.execute(build_test_command(index.repo, tests), timeout=RUN_TESTS_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            raise ValueError(f"Tests did not finish within {RUN_TESTS_TIMEOUT}s: {' '.join(tests)}")
+        return f"Ran: {' '.join(tests)}\n" + summarize_test_output(res.get("output", ""))
+
 
 class DumbEnvironment:
     """
@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 import openai
 
+from metrics import METRICS
+
 class LLM(ABC):
     """Abstract base class for Large Language Models."""
 
@@ -35,6 +37,9 @@ class OpenAIModel(LLM):
             model=self.model_name,
             messages=[{"role": "user", "content": prompt}],
         )
+        if response.usage is not None:
+            METRICS.inc("swe_llm_tokens_total", response.usage.prompt_tokens, kind="prompt")
+            METRICS.inc("swe_llm_tokens_total", response.usage.completion_tokens, kind="completion")
         content = response.choices[0].message.content or ""
         if not content.endswith(self.stop_token):
             content = f"{content}{self.stop_token}"
@@ -0,0 +1,197 @@
+"""
+Live run metrics shared by the runner, the agent, the LLM and the environment.
+
+All updates go through the module level `METRICS` registry, which is thread safe. It can
+be scraped in Prometheus text format from a local HTTP endpoint (`start_metrics_server`)
+and rendered as a `rich` live dashboard (`live_dashboard`) while `run_agent` is running.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rich.live import Live
+from rich.table import Table
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+STEP_BUCKETS = (5, 10, 20, 30, 40, 50, 60, 80, 100)
+
+# name -> (type, help, histogram buckets)
+METRIC_DEFINITIONS = {
+    "swe_instances_queued": ("gauge", "Instances waiting to be processed", None),
+    "swe_instances_running": ("gauge", "Instances currently being processed", None),
+    "swe_instances_done_total": ("counter", "Instances that finished with a result", None),
+    "swe_instances_failed_total": ("counter", "Instances that raised an error", None),
+    "swe_agent_steps_total": ("counter", "ReAct steps taken by all agents", None),
+    "swe_agent_steps_per_instance": ("histogram", "ReAct steps taken per agent run", STEP_BUCKETS),
+    "swe_llm_latency_seconds": ("histogram", "Latency of LLM generate calls", LATENCY_BUCKETS),
+    "swe_llm_tokens_total": ("counter", "Tokens consumed by LLM calls", None),
+    "swe_tool_latency_seconds": ("histogram", "Latency of tool calls", LATENCY_BUCKETS),
+    "swe_containers_active": ("gauge", "Containers currently running", None),
+}
+
+
+class MetricsRegistry:
+    """
+    Minimal thread safe registry of counters, gauges and histograms with labels.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._values: dict[tuple[str, tuple], float] = {}
+        # (name, labels) -> [bucket counts..., sum, count]
+        self._histograms: dict[tuple[str, tuple], list[float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dec(self, name: str, value: float = 1, **labels) -> None:
+        self.inc(name, -value, **labels)
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        buckets = METRIC_DEFINITIONS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.setdefault(key, [0] * (len(buckets) + 2))
+            bucket = bisect.bisect_left(buckets, value)
+            if bucket < len(buckets):  # values above the last bound only count towards +Inf
+                hist[bucket] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the wall time of the `with` block in the histogram `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def get(self, name: str, **labels) -> float:
+        """Value of a counter or gauge; summed over all label sets if no labels are given."""
+        with self._lock:
+            if labels:
+                return self._values.get((name, tuple(sorted(labels.items()))), 0)
+            return sum(v for (n, _), v in self._values.items() if n == name)
+
+    def histogram_summary(self, name: str) -> dict[tuple, tuple[int, float]]:
+        """Return {labels: (count, sum)} for the histogram `name`."""
+        with self._lock:
+            return {labels: (int(h[-1]), h[-2]) for (n, labels), h in self._histograms.items() if n == name}
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            values = dict(self._values)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+        lines = []
+        for name, (kind, help_text, buckets) in METRIC_DEFINITIONS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind != "histogram":
+                for (n, labels), value in values.items():
+                    if n == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                continue
+            for (n, labels), hist in histograms.items():
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, hist):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative:g}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist[-1]:g}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {hist[-2]:g}")
+                lines.append(f"{name}_count{_format_labels(labels)} {hist[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+METRICS = MetricsRegistry()
+
+
+def start_metrics_server(port: int, registry: MetricsRegistry = METRICS) -> ThreadingHTTPServer:
+    """Serve `registry` on http://127.0.0.1:<port>/metrics from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def render_dashboard(registry: MetricsRegistry = METRICS) -> Table:
+    """Build a `rich` table summarizing the current state of the run."""
+    elapsed = time.time() - registry.started_at
+    done = registry.get("swe_instances_done_total")
+    failed = registry.get("swe_instances_failed_total")
+    steps = registry.get("swe_agent_steps_total")
+
+    table = Table(title=f"SWE agent run ({elapsed / 60:.1f} min)", show_header=True)
+    table.add_column("metric")
+    table.add_column("value", justify="right")
+    table.add_row("instances queued / running", f"{registry.get('swe_instances_queued'):g} / {registry.get('swe_instances_running'):g}")
+    table.add_row("instances done / failed", f"{done:g} / {failed:g}")
+    table.add_row("throughput (instances/min)", f"{(done + failed) / max(elapsed / 60, 1e-9):.2f}")
+    table.add_row("containers active", f"{registry.get('swe_containers_active'):g}")
+    table.add_row("steps (total, /min)", f"{steps:g}, {steps / max(elapsed / 60, 1e-9):.1f}")
+    runs = registry.histogram_summary("swe_agent_steps_per_instance")
+    run_count = sum(c for c, _ in runs.values())
+    if run_count:
+        table.add_row("steps per instance (avg)", f"{sum(s for _, s in runs.values()) / run_count:.1f}")
+    table.add_row("LLM tokens", f"{registry.get('swe_llm_tokens_total'):,.0f}")
+    for (count, total) in registry.histogram_summary("swe_llm_latency_seconds").values():
+        table.add_row("LLM latency (calls, avg)", f"{count}, {total / max(count, 1):.2f}s")
+    for labels, (count, total) in sorted(registry.histogram_summary("swe_tool_latency_seconds").items()):
+        tool = dict(labels).get("tool", "")
+        table.add_row(f"tool {tool} (calls, avg)", f"{count}, {total / max(count, 1):.2f}s")
+    return table
+
+
+@contextmanager
+def live_dashboard(registry: MetricsRegistry = METRICS, refresh_per_second: float = 1):
+    """Show `render_dashboard` in a `rich` live display for the duration of the block."""
+    stop = threading.Event()
+    with Live(render_dashboard(registry), refresh_per_second=refresh_per_second, redirect_stdout=True) as live:
+
+        def refresh():
+            while not stop.wait(1 / refresh_per_second):
+                live.update(render_dashboard(registry))
+
+        thread = threading.Thread(target=refresh, daemon=True)
+        thread.start()
+        try:
+            yield live
+        finally:
+            stop.set()
+            thread.join()
+            live.update(render_dashboard(registry))
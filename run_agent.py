@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import concurrent.futures
+import contextlib
 import subprocess
 from pathlib import Path
 
@@ -28,6 +29,7 @@ from agent import ReactAgent
 from llm import OpenAIModel
 from response_parser import ResponseParser
 from envs import SWEEnvironment, DumbEnvironment
+from metrics import METRICS, start_metrics_server, live_dashboard
 
 def process_instance(
     instance: dict,
@@ -49,8 +51,12 @@ def process_instance(
     task = instance["problem_statement"]
     
     print(f"Processing instance {instance_id}")
+    METRICS.dec("swe_instances_queued")
+    METRICS.inc("swe_instances_running")
     agent = None    
+    env = None
     result = ""
+    failed = False
     
     try:
         # Initialize the environment
@@ -58,7 +64,7 @@ def process_instance(
         # Initialize the agent
         agent = ReactAgent("swe-agent", parser, llm)
         # Register tools available to the agent
-        agent.add_functions([env.run_bash_cmd, env.replace_in_file, env.show_file, env.generate_patch])
+        agent.add_functions([env.run_bash_cmd, env.replace_in_file, env.show_file, env.search_code, env.run_tests, env.generate_patch])
         agent.add_functions([agent.add_instructions_and_backtrack])
         # Run the agent
         output = agent.run(task, max_steps)         
@@ -68,8 +74,17 @@ def process_instance(
         
     except Exception as e:
         print(f"Error processing instance {instance_id}: {e}")
+        failed = True
         
     finally:
+        # Stop the container first so it is not leaked if saving the results fails
+        if env is not None:
+            try:
+                env.cleanup()
+            except Exception as e:
+                print(f"Error stopping container for instance {instance_id}: {e}")
+        METRICS.dec("swe_instances_running")
+        METRICS.inc("swe_instances_failed_total" if failed else "swe_instances_done_total")
         # Save the trajectory and update the predictions file
         save_traj(
             agent,
@@ -87,6 +102,8 @@ def main(
     output: str = typer.Option("outputs", "-o", "--output", help="Output directory", rich_help_panel="Basic"),
     model_name: str = typer.Option("gpt-5-mini", "--model", help="Model used", rich_help_panel="Basic"),
     max_steps: int = typer.Option(100, "--max-steps", help="Maximum number of steps", rich_help_panel="Basic"),
+    metrics_port: int = typer.Option(9477, "--metrics-port", help="Port of the local Prometheus metrics endpoint (0 to disable)", rich_help_panel="Monitoring"),
+    dashboard: bool = typer.Option(True, "--dashboard/--no-dashboard", help="Show a live progress dashboard", rich_help_panel="Monitoring"),
     # NOTE: provide any extra arguments if needed
 ) -> None:
     time_str = datetime.now().strftime("%H-%M-%S")
@@ -99,6 +116,13 @@ def main(
     print(f"Loading dataset {dataset_path}, split {split}...")
     instances = list(load_dataset(dataset_path, split=split))
     print(f"Running on {len(instances)} instances...")
+    METRICS.set("swe_instances_queued", len(instances))
+    if metrics_port:
+        try:
+            start_metrics_server(metrics_port)
+            print(f"Serving metrics on http://127.0.0.1:{metrics_port}/metrics")
+        except OSError as e:
+            print(y_str(f"Could not serve metrics on port {metrics_port}, continuing without the endpoint: ") + f"{e}")
 
     def process_futures(futures: dict[concurrent.futures.Future, str]):
         for future in concurrent.futures.as_completed(futures):
@@ -110,7 +134,8 @@ def main(
                 instance_id = futures[future]
                 print(f"Error in future for instance {instance_id}: {e}")
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+    with live_dashboard() if dashboard else contextlib.nullcontext(), \
+            concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
         futures = {
             executor.submit(process_instance, instance, output_path, model_name, max_steps): instance[
                 "instance_id"
@@ -0,0 +1,352 @@
+"""
+Per-repo code search index shared across SWE-Bench instances.
+
+Many instances share the same repository at nearby commits, so instead of scanning
+/testbed with `grep -r` on every query we keep a trigram + symbol index per (repo, commit):
+- File contents are stored on the host in a content-addressed blob store keyed by git blob
+  sha, so a file is only ever copied out of a container once per repo.
+- An index for a new commit of an already indexed repo is derived from the existing one by
+  re-indexing only the files whose blob sha changed.
+- Queries intersect trigram postings (sorted arrays of file ids) to get candidate files
+  and only scan those, returning ranked file:line hits.
+- Built indexes are pickled per (repo, commit) on the host, so later processes load them
+  instead of rebuilding.
+"""
+
+import fnmatch
+import json
+import os
+import pickle
+import re
+import threading
+from array import array
+from pathlib import Path
+
+INDEX_CACHE_DIR = Path(os.environ.get("SWE_SEARCH_CACHE", "~/.cache/cs294-hw1/search")).expanduser()
+INDEXED_EXTENSIONS = {
+    ".py", ".pyx", ".pxd", ".pyi", ".c", ".h", ".cpp", ".hpp", ".js", ".ts",
+    ".cfg", ".ini", ".toml", ".txt", ".rst", ".md", ".yml", ".yaml", ".json",
+}
+MAX_FILE_BYTES = 512 * 1024
+FETCH_BATCH = 500
+MAX_CACHED_INDEXES = 8
+
+_SYMBOL_RE = re.compile(r"^\s*(?:async\s+)?(?:def|class)\s+([A-Za-z_]\w*)")
+_OUTPUT_MARKER = "----SEARCH_INDEX_JSON----"
+
+# Reads git blobs (mode "blob") or working tree files (mode "file") inside the container
+# and prints them as a JSON object. Kept python2/3.5 compatible for old testbed images.
+_FETCH_SCRIPT = r"""
+import json, subprocess, sys
+mode = %(mode)r
+keys = json.loads(%(keys)r)
+out = {}
+if mode == "blob":
+    p = subprocess.Popen(["git", "cat-file", "--batch"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    data = p.communicate(("\n".join(keys) + "\n").encode())[0]
+    pos = 0
+    while pos < len(data):
+        nl = data.index(b"\n", pos)
+        header = data[pos:nl].split()
+        pos = nl + 1
+        if len(header) < 3:
+            continue
+        size = int(header[2])
+        body = data[pos:pos + size]
+        pos += size + 1
+        if b"\0" not in body:
+            out[header[0].decode()] = body.decode("utf-8", "replace")
+else:
+    for key in keys:
+        try:
+            with open(key, "rb") as f:
+                body = f.read()
+        except (IOError, OSError):
+            out[key] = None
+            continue
+        out[key] = None if b"\0" in body else body.decode("utf-8", "replace")
+sys.stdout.write(%(marker)r + "\n" + json.dumps(out))
+"""
+
+_INDEXES: dict[tuple[str, str], "CodeSearchIndex"] = {}
+_INDEXES_LOCK = threading.Lock()
+_REPO_LOCKS: dict[str, threading.Lock] = {}
+
+
+def is_indexable(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in INDEXED_EXTENSIONS
+
+
+class CodeSearchIndex:
+    """
+    Trigram and symbol index over the source files of a repo at one commit.
+    """
+
+    def __init__(self, repo: str, commit: str):
+        self.repo = repo
+        self.commit = commit
+        self.manifest: dict[str, str] = {}  # path -> git blob sha
+        self.file_ids: dict[str, int] = {}
+        self.paths: list[str | None] = []
+        self.lines: list[list[str] | None] = []
+        # trigram -> sorted file ids; ids of removed files are left in and skipped at query time
+        self.postings: dict[str, array] = {}
+        self.symbols: dict[str, list[tuple[int, int]]] = {}  # name -> [(file id, line number)]
+
+    def derive(self, commit: str) -> "CodeSearchIndex":
+        """Copy this index so that it can be updated incrementally for another commit."""
+        index = CodeSearchIndex(self.repo, commit)
+        index.manifest = dict(self.manifest)
+        index.file_ids = dict(self.file_ids)
+        index.paths = list(self.paths)
+        index.lines = list(self.lines)
+        index.postings = dict(self.postings)
+        index.symbols = {name: list(defs) for name, defs in self.symbols.items()}
+        return index
+
+    def add_file(self, path: str, sha: str, text: str) -> None:
+        self.add_files([(path, sha, text)])
+
+    def add_files(self, files: list[tuple[str, str, str]]) -> None:
+        """Index (path, blob sha, text) triples."""
+        for path, _, _ in files:
+            if path in self.file_ids:
+                self.remove_file(path)
+        new_postings: dict[str, list[int]] = {}
+        for path, sha, text in files:
+            fid = len(self.paths)
+            lines = text.splitlines()
+            self.manifest[path] = sha
+            self.file_ids[path] = fid
+            self.paths.append(path)
+            self.lines.append(lines)
+            for tg in _trigrams("\n".join(lines).lower()):
+                fids = new_postings.get(tg)
+                if fids is None:
+                    new_postings[tg] = [fid]
+                else:
+                    fids.append(fid)
+            for lineno, line in enumerate(lines, 1):
+                m = _SYMBOL_RE.match(line)
+                if m:
+                    self.symbols.setdefault(m.group(1), []).append((fid, lineno))
+
+        # New ids are larger than existing ones, so appending keeps the postings sorted. A new
+        # array is created rather than extending in place, as derived indexes share them.
+        for tg, fids in new_postings.items():
+            old = self.postings.get(tg)
+            self.postings[tg] = array("I", fids) if old is None else old + array("I", fids)
+
+    def remove_file(self, path: str) -> None:
+        fid = self.file_ids.pop(path, None)
+        self.manifest.pop(path, None)
+        if fid is None:
+            return
+        for line in self.lines[fid] or ():
+            m = _SYMBOL_RE.match(line)
+            if m and m.group(1) in self.symbols:
+                defs = [d for d in self.symbols[m.group(1)] if d[0] != fid]
+                if defs:
+                    self.symbols[m.group(1)] = defs
+                else:
+                    del self.symbols[m.group(1)]
+        self.paths[fid] = None
+        self.lines[fid] = None
+
+    def _candidates(self, query: str) -> list[int]:
+        trigrams = _trigrams(query.lower())
+        if not trigrams:
+            return [fid for fid in self.file_ids.values()]
+        postings = []
+        for tg in trigrams:
+            fids = self.postings.get(tg)
+            if fids is None:
+                return []
+            postings.append(fids)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for fids in postings[1:]:
+            candidates.intersection_update(fids)
+            if not candidates:
+                return []
+        return sorted(fid for fid in candidates if self.paths[fid] is not None)
+
+    def search(
+        self,
+        query: str,
+        path_glob: str = "",
+        overlay: dict[str, str | None] | None = None,
+        max_results: int = 50,
+    ) -> tuple[int, list[tuple[str, int, str]]]:
+        """
+        Search for `query` (smart case: case-insensitive unless it contains upper case).
+
+        `overlay` maps paths to their current working tree content (None if deleted) and
+        takes precedence over the indexed content of those paths.
+
+        Returns the total number of hits and the best `max_results` (path, line number, line)
+        hits, ranked by: symbol definition, whole word match, non-test file, path, line.
+        """
+        overlay = overlay or {}
+        ignore_case = query == query.lower()
+        needle = query.lower() if ignore_case else query
+        word_re = re.compile(r"(?<!\w)" + re.escape(query) + r"(?!\w)", re.IGNORECASE if ignore_case else 0)
+        definitions = {
+            (self.paths[fid], lineno) for fid, lineno in self.symbols.get(query, []) if self.paths[fid] not in overlay
+        }
+
+        sources = [(self.paths[fid], self.lines[fid]) for fid in self._candidates(query) if self.paths[fid] not in overlay]
+        sources += [(path, text.splitlines()) for path, text in overlay.items() if text is not None and is_indexable(path)]
+
+        hits = []
+        for path, lines in sources:
+            if path_glob and not fnmatch.fnmatch(path, path_glob):
+                continue
+            is_test = "test" in path.lower()
+            for lineno, line in enumerate(lines, 1):
+                if needle not in (line.lower() if ignore_case else line):
+                    continue
+                is_definition = (path, lineno) in definitions
+                if path in overlay:
+                    m = _SYMBOL_RE.match(line)
+                    is_definition = bool(m) and m.group(1) == query
+                score = 4 * is_definition + 2 * bool(word_re.search(line)) + (not is_test)
+                hits.append((-score, path, lineno, line.strip()))
+        hits.sort()
+        return len(hits), [(path, lineno, line) for _, path, lineno, line in hits[:max_results]]
+
+
+def _trigrams(text: str) -> set[str]:
+    return set(map("".join, zip(text, text[1:], text[2:])))
+
+
+def _repo_dir(repo: str) -> Path:
+    return INDEX_CACHE_DIR / repo.replace("/", "__")
+
+
+def _blob_path(repo: str, sha: str) -> Path:
+    return _repo_dir(repo) / "blobs" / sha[:2] / sha
+
+
+def _index_path(repo: str, commit: str) -> Path:
+    return _repo_dir(repo) / "indexes" / f"{commit}.pickle"
+
+
+def _write_atomic(path: Path, data: str | bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    if isinstance(data, bytes):
+        tmp.write_bytes(data)
+    else:
+        tmp.write_text(data, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _load_index(path: Path) -> CodeSearchIndex | None:
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.PickleError, EOFError, AttributeError):
+        return None
+
+
+def _latest_saved_index(repo: str) -> CodeSearchIndex | None:
+    """Most recently saved index of `repo` on the host, used as a base to derive from."""
+    saved = sorted((_repo_dir(repo) / "indexes").glob("*.pickle"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in saved:
+        index = _load_index(path)
+        if index is not None:
+            return index
+    return None
+
+
+def _execute_fetch(env, mode: str, keys: list[str]) -> dict[str, str | None]:
+    """Fetch git blobs or working tree files from the container in batches."""
+    fetched: dict[str, str | None] = {}
+    for i in range(0, len(keys), FETCH_BATCH):
+        script = _FETCH_SCRIPT % {"mode": mode, "keys": json.dumps(keys[i:i + FETCH_BATCH]), "marker": _OUTPUT_MARKER}
+        res = env.execute(f"python - << 'SEARCH_INDEX_EOF'\n{script}\nSEARCH_INDEX_EOF")
+        output = res.get("output", "")
+        marker = output.rfind(_OUTPUT_MARKER)
+        if marker == -1:
+            raise ValueError(f"Failed to read files from the container: {output[-500:]}")
+        fetched.update(json.loads(output[marker + len(_OUTPUT_MARKER):]))
+    return fetched
+
+
+def _list_tree(env, repo: str, commit: str) -> dict[str, str]:
+    """Return the indexable files of `commit` as path -> blob sha, cached on the host."""
+    manifest_path = _repo_dir(repo) / "manifests" / f"{commit}.json"
+    if manifest_path.exists():
+        return json.loads(manifest_path.read_text(encoding="utf-8"))
+    res = env.execute(f"git ls-tree -r -l -z {commit}")
+    if res.get("returncode", 0):
+        raise ValueError(f"Failed to list files of {commit}: {res.get('output', '')}")
+    manifest = {}
+    for entry in res.get("output", "").split("\0"):
+        if "\t" not in entry:
+            continue
+        meta, path = entry.split("\t", 1)
+        _, kind, sha, size = meta.split()
+        if kind == "blob" and size != "-" and int(size) <= MAX_FILE_BYTES and is_indexable(path):
+            manifest[path] = sha
+    _write_atomic(manifest_path, json.dumps(manifest))
+    return manifest
+
+
+def get_index(env, repo: str, commit: str) -> CodeSearchIndex:
+    """
+    Return the index of `repo` at `commit`, building it if necessary.
+
+    `env` is the container environment (anything with `execute(command) -> dict`) checked
+    out at `commit`. The index is derived from the most recent index of the same repo when
+    one is cached, and only blobs missing from the host blob store are read from the container.
+    """
+    key = (repo, commit)
+    with _INDEXES_LOCK:
+        if key in _INDEXES:
+            return _INDEXES[key]
+        repo_lock = _REPO_LOCKS.setdefault(repo, threading.Lock())
+
+    with repo_lock:
+        with _INDEXES_LOCK:
+            if key in _INDEXES:
+                return _INDEXES[key]
+            base = next((idx for (r, _), idx in reversed(_INDEXES.items()) if r == repo), None)
+
+        index = _load_index(_index_path(repo, commit))
+        if index is None:
+            index = _build_index(env, repo, commit, base or _latest_saved_index(repo))
+            _write_atomic(_index_path(repo, commit), pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL))
+
+        with _INDEXES_LOCK:
+            _INDEXES[key] = index
+            while len(_INDEXES) > MAX_CACHED_INDEXES:
+                del _INDEXES[next(iter(_INDEXES))]
+        return index
+
+
+def _build_index(env, repo: str, commit: str, base: CodeSearchIndex | None) -> CodeSearchIndex:
+    manifest = _list_tree(env, repo, commit)
+    index = base.derive(commit) if base else CodeSearchIndex(repo, commit)
+    for path, sha in list(index.manifest.items()):
+        if manifest.get(path) != sha:
+            index.remove_file(path)
+    changed = {path: sha for path, sha in manifest.items() if index.manifest.get(path) != sha}
+
+    missing = sorted({sha for sha in changed.values() if not _blob_path(repo, sha).exists()})
+    for sha, text in _execute_fetch(env, "blob", missing).items():
+        _write_atomic(_blob_path(repo, sha), text)
+
+    files = []
+    for path, sha in changed.items():
+        blob = _blob_path(repo, sha)
+        if blob.exists():  # binary blobs are never stored
+            files.append((path, sha, blob.read_text(encoding="utf-8")))
+    index.add_files(files)
+    return index
+
+
+def read_working_tree(env, paths: list[str]) -> dict[str, str | None]:
+    """Read the current content of `paths` from the container (None for deleted or binary files)."""
+    return _execute_fetch(env, "file", [p for p in paths if is_indexable(p)])
@@ -0,0 +1,216 @@
+"""
+Selection and execution of the tests related to the files changed by the agent.
+
+The file -> test mapping is computed once per (repo, commit) from the search index (see
+search_index.py), so no extra scan of the container is needed:
+- a test file is related to a source file if it imports it (directly or via `from x import y`)
+  or if its name matches the source file name (`foo.py` <-> `test_foo.py`).
+Selected tests are run in parallel (pytest-xdist when installed, otherwise one pytest process
+per group of files; Django's own runner with --parallel for django) and only a compact
+summary with the relevant failure tracebacks is returned to the model.
+"""
+
+import os
+import re
+import shlex
+import threading
+
+from search_index import CodeSearchIndex
+
+RUN_TESTS_TIMEOUT = 600
+PARALLEL_WORKERS = 4
+MAX_SELECTED_TESTS = 20
+MAX_FAILURES_SHOWN = 5
+MAX_TRACEBACK_LINES = 30
+LOG_PREFIX = "/tmp/.swe_env_run_tests"
+
+_IMPORT_RE = re.compile(r"^\s*(?:from\s+(\.*[\w.]*)\s+import\s+(.+)|import\s+([\w.]+(?:\s*,\s*[\w.]+)*))")
+_SOURCE_ROOTS = ("", "src/", "lib/")
+_PYTEST_SUMMARY_RE = re.compile(r"^=*\s*((?:\d+ \w+(?:, )?)+) in [\d.]+ ?s(?:econds)?")
+_PYTEST_FAILURE_HEADER_RE = re.compile(r"^_{3,} (.+?) _{3,}$")
+_DJANGO_FAILURE_HEADER_RE = re.compile(r"^(FAIL|ERROR): (.+)$")
+_DJANGO_RAN_RE = re.compile(r"^Ran (\d+) tests? in [\d.]+s")
+_DJANGO_RESULT_RE = re.compile(r"^(OK|FAILED)(?: \((.+)\))?")
+
+_TEST_MAPS: dict[tuple[str, str], dict[str, list[str]]] = {}
+_TEST_MAPS_LOCK = threading.Lock()
+
+
+def is_test_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.endswith(".py") and (name.startswith("test") or name.endswith(("_test.py", "_tests.py")))
+
+
+def _module_path(module: str, known: set[str]) -> str | None:
+    rel = module.replace(".", "/")
+    for root in _SOURCE_ROOTS:
+        for candidate in (f"{root}{rel}.py", f"{root}{rel}/__init__.py"):
+            if candidate in known:
+                return candidate
+    return None
+
+
+def _imported_modules(line: str, path: str) -> list[str]:
+    m = _IMPORT_RE.match(line)
+    if not m:
+        return []
+    if m.group(3):
+        return [name.strip() for name in m.group(3).split(",")]
+    module, names = m.group(1), m.group(2)
+    if module.startswith("."):
+        # Relative import: resolve against the package of the importing file
+        dots = len(module) - len(module.lstrip("."))
+        package = os.path.dirname(path).split("/")
+        package = package[: len(package) - (dots - 1)] if dots > 1 else package
+        module = ".".join([p for p in package if p] + ([module.lstrip(".")] if module.lstrip(".") else []))
+    names = [n.strip().split()[0] for n in names.strip("()\\ ").split(",") if n.strip() and n.strip() != "*"]
+    return [module] + [f"{module}.{name}" for name in names]
+
+
+def build_test_map(index: CodeSearchIndex) -> dict[str, list[str]]:
+    """Map each source file of `index` to the test files that import it or are named after it."""
+    known = set(index.file_ids)
+    by_name: dict[str, list[str]] = {}
+    mapping: dict[str, set[str]] = {}
+    for path, fid in index.file_ids.items():
+        if not is_test_file(path):
+            continue
+        stem = os.path.basename(path)[:-3]
+        by_name.setdefault(re.sub(r"^tests?_|_tests?$", "", stem), []).append(path)
+        for line in index.lines[fid]:
+            for module in _imported_modules(line, path):
+                source = _module_path(module, known)
+                if source and source != path and not is_test_file(source):
+                    mapping.setdefault(source, set()).add(path)
+    result = {}
+    for path in known:
+        if not path.endswith(".py") or is_test_file(path):
+            continue
+        # Tests named after the file come first, then the ones importing it
+        named = sorted(by_name.get(os.path.basename(path)[:-3], []))
+        imported = sorted(mapping.get(path, set()) - set(named))
+        if named or imported:
+            result[path] = named + imported
+    return result
+
+
+def get_test_map(index: CodeSearchIndex) -> dict[str, list[str]]:
+    key = (index.repo, index.commit)
+    with _TEST_MAPS_LOCK:
+        if key not in _TEST_MAPS:
+            _TEST_MAPS[key] = build_test_map(index)
+        return _TEST_MAPS[key]
+
+
+def select_tests(test_map: dict[str, list[str]], changed_paths: list[str]) -> list[str]:
+    """Return the test files related to `changed_paths` (changed test files first)."""
+    selected = [p for p in changed_paths if is_test_file(p)]
+    for path in changed_paths:
+        selected += test_map.get(path, [])
+    return list(dict.fromkeys(selected))[:MAX_SELECTED_TESTS]
+
+
+def _django_label(test: str) -> str | None:
+    """
+    Convert a test file, directory or pytest style node id under tests/ to a Django
+    runtests.py label (e.g. `tests/queries/tests.py::Tests::test_x` -> `queries.tests.Tests.test_x`).
+    Dotted labels are passed through; other paths are dropped.
+    """
+    path, *names = test.split("::")
+    if "/" not in path and not path.endswith(".py"):
+        return ".".join([path] + names) if path else None
+    path = path.rstrip("/")
+    if path.startswith("./"):
+        path = path[2:]
+    if not path.startswith("tests/"):
+        return None
+    path = path[len("tests/"):]
+    if path.endswith(".py"):
+        path = path[:-3]
+    return ".".join([path.replace("/", ".")] + names)
+
+
+def build_test_command(repo: str, tests: list[str], workers: int = PARALLEL_WORKERS) -> str:
+    """Build the shell command running `tests` in parallel inside the container."""
+    if repo == "django/django":
+        labels = [label for label in map(_django_label, tests) if label]
+        if not labels:
+            # runtests.py without labels would run the whole suite
+            raise ValueError("No Django test modules under tests/ to run")
+        return f"python tests/runtests.py --settings=test_sqlite --parallel {workers} {' '.join(map(shlex.quote, labels))} 2>&1"
+
+    pytest = "python -m pytest -q -rfE --tb=short -p no:cacheprovider"
+    groups = [tests[i::workers] for i in range(min(workers, len(tests)))]
+    # Without pytest-xdist, run one pytest process per group of files in the background
+    pool = " ".join(
+        f"({pytest} {' '.join(map(shlex.quote, group))} > {LOG_PREFIX}_{i}.log 2>&1) &"
+        for i, group in enumerate(groups)
+    )
+    return (
+        f"rm -f {LOG_PREFIX}_*.log; "
+        f"if python -c 'import xdist' 2>/dev/null; then "
+        f"{pytest} -n {workers} {' '.join(map(shlex.quote, tests))} 2>&1; "
+        f"else {pool} wait; cat {LOG_PREFIX}_*.log; fi"
+    )
+
+
+def _failure_blocks(lines: list[str], header_re: re.Pattern, name_group: int) -> list[tuple[str, list[str]]]:
+    """Split out the traceback of each failure; a block ends at the next header or section."""
+    blocks: list[tuple[str, list[str]]] = []
+    current = None
+    for line in lines:
+        m = header_re.match(line)
+        if m:
+            current = (m.group(name_group), [])
+            blocks.append(current)
+        elif line.startswith(("=====", "Ran ")):
+            current = None
+        elif current is not None and line.strip() and set(line.strip()) != {"-"}:
+            current[1].append(line)
+    return blocks
+
+
+def summarize_test_output(output: str) -> str:
+    """
+    Reduce the output of a pytest or Django test run to the counts and the tail of the
+    traceback of each failure.
+    """
+    lines = output.splitlines()
+    counts: dict[str, int] = {}
+    for line in lines:
+        m = _PYTEST_SUMMARY_RE.match(line.strip())
+        if m:
+            for part in m.group(1).split(", "):
+                number, kind = part.split(" ", 1)
+                kind = {"error": "errors"}.get(kind, kind)
+                counts[kind] = counts.get(kind, 0) + int(number)
+    blocks = _failure_blocks(lines, _PYTEST_FAILURE_HEADER_RE, 1)
+
+    if not counts:
+        ran = [int(m.group(1)) for m in map(_DJANGO_RAN_RE.match, lines) if m]
+        results = [m for m in map(_DJANGO_RESULT_RE.match, lines) if m]
+        if ran and results:
+            counts["ran"] = sum(ran)
+            for m in results:
+                for part in (m.group(2) or "").split(", "):
+                    if "=" in part:
+                        kind, number = part.split("=")
+                        counts[kind] = counts.get(kind, 0) + int(number)
+            blocks = _failure_blocks(lines, _DJANGO_FAILURE_HEADER_RE, 2)
+
+    if not counts:
+        tail = "\n".join(lines[-MAX_TRACEBACK_LINES * 2:])
+        return f"Could not find a test summary in the output. Last lines:\n{tail}"
+
+    summary = ", ".join(f"{number} {kind}" for kind, number in counts.items())
+    parts = [f"Result: {summary}"]
+    short_summary = [line for line in lines if line.startswith(("FAILED ", "ERROR ")) and not line.startswith("FAILED (")]
+    if short_summary:
+        parts.append("\n".join(short_summary))
+    for name, body in blocks[:MAX_FAILURES_SHOWN]:
+        if len(body) > MAX_TRACEBACK_LINES:
+            body = ["..."] + body[-MAX_TRACEBACK_LINES:]
+        parts.append(f"--- {name} ---\n" + "\n".join(body))
+    if len(blocks) > MAX_FAILURES_SHOWN:
+        parts.append(f"... and {len(blocks) - MAX_FAILURES_SHOWN} more failures")
+    return "\n\n".join(parts)